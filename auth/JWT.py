@@ -1,4 +1,11 @@
 import jwt
+import base64
+import hashlib
+import hmac
+import json
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from fastapi import HTTPException, Depends, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -6,35 +13,138 @@ from typing import Optional
 
 # Import configuration
 from config import config
+from db.teacher_auth import get_teacher_id
 
 security = HTTPBearer()
 
+# JWT settings are fixed for the process lifetime; bind them once for the hot path
+_SECRET = config.JWT_SECRET_KEY
+_SECRET_BYTES = _SECRET.encode()
+_ALG = config.JWT_ALGORITHM
+_ALGS = [_ALG]
+_EXPIRATION_DELTA = timedelta(hours=config.JWT_EXPIRATION_HOURS)
+_TOKEN_TYPE = "access_token"
+
+# Verified tokens: sha256(token) -> ((username, teacher_id), exp timestamp)
+_TOKEN_CACHE_SIZE = 4096
+_TOKEN_CACHE: "OrderedDict[bytes, tuple]" = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def _cache_lookup(key: bytes) -> Optional[tuple]:
+    """Return the cached (username, teacher_id) for a token key, dropping expired entries"""
+    now = time.time()
+    with _token_cache_lock:
+        # Entries are inserted roughly in expiry order, so trim from the front
+        while _TOKEN_CACHE:
+            oldest_key, (_, oldest_exp) = next(iter(_TOKEN_CACHE.items()))
+            if oldest_exp > now:
+                break
+            del _TOKEN_CACHE[oldest_key]
+        entry = _TOKEN_CACHE.get(key)
+        if entry is None or entry[1] <= now:
+            return None
+        return entry[0]
+
+def _cache_store(key: bytes, identity: tuple, exp: float) -> None:
+    """Remember a successfully verified token until it expires"""
+    with _token_cache_lock:
+        _TOKEN_CACHE[key] = (identity, exp)
+        while len(_TOKEN_CACHE) > _TOKEN_CACHE_SIZE:
+            _TOKEN_CACHE.popitem(last=False)
+
+def _cache_set_teacher_id(key: bytes, teacher_id: int) -> None:
+    """Fill in the teacher_id of a cached token that was issued without the claim"""
+    with _token_cache_lock:
+        entry = _TOKEN_CACHE.get(key)
+        if entry is not None:
+            (username, _), exp = entry
+            _TOKEN_CACHE[key] = ((username, teacher_id), exp)
+
 def generate_token(data: dict) -> str:
     """Generate a JWT token with expiration"""
-    to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(hours=config.JWT_EXPIRATION_HOURS)
-    to_encode.update({
-        "exp": expire,
-        "iat": datetime.utcnow(),
-        "type": "access_token"
-    })
-    encoded_jwt = jwt.encode(to_encode, config.JWT_SECRET_KEY, algorithm=config.JWT_ALGORITHM)
+    now = datetime.utcnow()
+    to_encode = {**data, "exp": now + _EXPIRATION_DELTA, "iat": now, "type": _TOKEN_TYPE}
+    encoded_jwt = jwt.encode(to_encode, _SECRET, algorithm=_ALG)
     return encoded_jwt
 
-def verify_token(token: str) -> str:
-    """Verify a JWT token and return the username"""
+def _b64url_decode(segment: str) -> bytes:
+    """Decode an unpadded base64url JWT segment"""
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+def _int_claim(payload: dict, name: str, error: type, message: str) -> Optional[int]:
+    """Read a numeric time claim the way PyJWT does (int() conversion); None if absent"""
+    if name not in payload:
+        return None
+    try:
+        return int(payload[name])
+    except (ValueError, TypeError, OverflowError):
+        raise error(message) from None
+
+def _decode_hs256(token: str) -> dict:
+    """Verify an HS256 token with hmac directly, skipping PyJWT's generic pipeline.
+
+    Checks the signature plus the iat, nbf and exp claims with zero leeway, like
+    jwt.decode with default options, and raises the same PyJWT exception types so
+    callers handle both paths alike. Other registered claims (aud, iss, sub, jti)
+    are not checked; tokens issued here don't carry them.
+    """
+    try:
+        signing_input, _, signature_segment = token.rpartition('.')
+        header_segment, _, payload_segment = signing_input.partition('.')
+        header = json.loads(_b64url_decode(header_segment))
+        signature = _b64url_decode(signature_segment)
+        payload = json.loads(_b64url_decode(payload_segment))
+    except (ValueError, TypeError) as e:
+        raise jwt.DecodeError(f"Invalid token encoding: {e}")
+    
+    if not isinstance(header, dict) or header.get("alg") != "HS256" or not isinstance(payload, dict):
+        raise jwt.InvalidAlgorithmError("The specified alg value is not allowed")
+    
+    expected = hmac.new(_SECRET_BYTES, signing_input.encode(), hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, signature):
+        raise jwt.InvalidSignatureError("Signature verification failed")
+    
+    now = time.time()
+    iat = _int_claim(payload, "iat", jwt.InvalidIssuedAtError, "Issued At claim (iat) must be an integer.")
+    if iat is not None and iat > now:
+        raise jwt.ImmatureSignatureError("The token is not yet valid (iat)")
+    
+    nbf = _int_claim(payload, "nbf", jwt.DecodeError, "Not Before claim (nbf) must be an integer.")
+    if nbf is not None and nbf > now:
+        raise jwt.ImmatureSignatureError("The token is not yet valid (nbf)")
+    
+    exp = _int_claim(payload, "exp", jwt.DecodeError, "Expiration Time claim (exp) must be an integer.")
+    if exp is not None and exp <= now:
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return payload
+
+def _verify_identity(token: str) -> tuple:
+    """Verify a JWT token and return (username, teacher_id); teacher_id is None for older tokens"""
+    cache_key = hashlib.sha256(token.encode()).digest()
+    cached_identity = _cache_lookup(cache_key)
+    if cached_identity is not None:
+        return cached_identity
+    
     try:
-        payload = jwt.decode(token, config.JWT_SECRET_KEY, algorithms=[config.JWT_ALGORITHM])
+        if _ALG == "HS256":
+            payload = _decode_hs256(token)
+        else:
+            payload = jwt.decode(token, _SECRET, algorithms=_ALGS)
         username: str = payload.get("username")
         token_type: str = payload.get("type")
         
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid token: missing username")
         
-        if token_type != "access_token":
+        if token_type != _TOKEN_TYPE:
             raise HTTPException(status_code=401, detail="Invalid token type")
+        
+        identity = (username, payload.get("teacher_id"))
+        exp = payload.get("exp")
+        if exp is not None:
+            _cache_store(cache_key, identity, float(exp))
             
-        return username
+        return identity
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
@@ -42,6 +152,10 @@ def verify_token(token: str) -> str:
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Token verification failed: {str(e)}")
 
+def verify_token(token: str) -> str:
+    """Verify a JWT token and return the username"""
+    return _verify_identity(token)[0]
+
 def get_current_teacher(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
     """Get current authenticated teacher (required authentication)"""
     if not credentials or not credentials.credentials:
@@ -50,6 +164,28 @@ def get_current_teacher(credentials: HTTPAuthorizationCredentials = Depends(secu
     token = credentials.credentials
     return verify_token(token)
 
+def get_current_identity(credentials: HTTPAuthorizationCredentials = Depends(security)) -> tuple:
+    """Get the authenticated teacher's (username, teacher_id) from a single token verification"""
+    if not credentials or not credentials.credentials:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    
+    token = credentials.credentials
+    username, teacher_id = _verify_identity(token)
+    if teacher_id is not None:
+        return username, teacher_id
+    
+    # Tokens issued before teacher_id was added to the claims: resolve once,
+    # then remember it alongside the verified token so later requests skip the DB
+    teacher_id = get_teacher_id(username)
+    if teacher_id is None:
+        raise HTTPException(status_code=401, detail="Teacher not found")
+    _cache_set_teacher_id(hashlib.sha256(token.encode()).digest(), teacher_id)
+    return username, teacher_id
+
+def get_current_teacher_id(identity: tuple = Depends(get_current_identity)) -> int:
+    """Get the numeric teacher_id of the authenticated teacher (required authentication)"""
+    return identity[1]
+
 def get_current_teacher_optional(request: Request) -> Optional[str]:
     """
     Optional authentication that supports both Authorization header and token query parameter.
@@ -4,8 +4,11 @@ from typing import List
 from dotenv import load_dotenv
 import logging
 
-# Load environment variables from .env file
-load_dotenv()
+# Load environment variables from .env file once per process tree;
+# child processes inherit the already-populated environment
+if not os.environ.get('_TEACHER_APP_DOTENV_LOADED'):
+    load_dotenv(override=False)
+    os.environ['_TEACHER_APP_DOTENV_LOADED'] = '1'
 
 class Config:
     """Application configuration with environment variable support"""
@@ -13,6 +16,11 @@ class Config:
     # Database Configuration
     DATABASE_NAME: str = os.getenv('DATABASE_NAME', 'Teachers.db')
     DATABASE_PATH: str = os.getenv('DATABASE_PATH', '.')
+    DB_POOL_SIZE: int = int(os.getenv('DB_POOL_SIZE', '8'))
+    DB_POOL_TIMEOUT: float = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '256'))
+    DB_CACHE_SIZE_KB: int = int(os.getenv('DB_CACHE_SIZE_KB', '65536'))  # Page cache per pooled connection
+    DB_MMAP_SIZE: int = int(os.getenv('DB_MMAP_SIZE', '268435456'))  # 256MB memory-mapped I/O, 0 disables
     
     # JWT Configuration
     JWT_SECRET_KEY: str = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -37,7 +45,7 @@ class Config:
     MAX_STUDENTS_PER_GROUP: int = int(os.getenv('MAX_STUDENTS_PER_GROUP', '500'))  # Performance limit  
     
     # Security Configuration
-    BCRYPT_ROUNDS: int = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    BCRYPT_ROUNDS: int = int(os.getenv('BCRYPT_ROUNDS', '10'))
     
     @classmethod
     def get_database_url(cls) -> str:
@@ -1,5 +1,7 @@
-from pydantic import BaseModel
+from typing import Annotated
+from pydantic import BaseModel, StringConstraints
 
 class Teacher(BaseModel):
-    username:str
+    # Stripped once here so the endpoints and db helpers can use it as-is
+    username:Annotated[str, StringConstraints(strip_whitespace=True)]
     password:str
@@ -1,6 +1,8 @@
 # Database connection management for Teacher App
 import sqlite3
 import threading
+import queue
+import time
 from contextlib import contextmanager
 from typing import Generator
 import os
@@ -11,10 +13,15 @@ from config import config
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    """Thread-safe database connection manager with connection pooling"""
+    """Thread-safe database connection manager with a bounded connection pool"""
     
     _instance = None
     _lock = threading.Lock()
+    _init_lock = threading.Lock()
+    initialized = False
+    
+    # PRAGMA optimize is meant for connection close or periodic runs, not every query
+    _OPTIMIZE_INTERVAL = 3600  # seconds
     
     def __new__(cls):
         if cls._instance is None:
@@ -24,10 +31,27 @@ class DatabaseManager:
         return cls._instance
     
     def __init__(self):
-        if not hasattr(self, 'initialized'):
+        # __init__ runs on every DatabaseManager() call; only the first one sets up state.
+        # The flag is set last so no caller can see a half-built pool.
+        with self._init_lock:
+            if self.initialized:
+                return
             self.db_path = config.get_database_url()
-            self.initialized = True
             self._ensure_database_exists()
+            self._open_pool()
+            self.initialized = True
+    
+    def _open_pool(self):
+        """Fill a fresh pool with DB_POOL_SIZE connections"""
+        self._pool = queue.LifoQueue(maxsize=config.DB_POOL_SIZE)
+        for i in range(config.DB_POOL_SIZE):
+            conn = self._create_connection()
+            if i == 0:
+                # journal_mode persists in the database file, so set it once
+                conn.execute("PRAGMA journal_mode = WAL")  # Enable WAL mode for better concurrency
+            self._pool.put(conn)
+        self._next_optimize = time.monotonic() + self._OPTIMIZE_INTERVAL
+        self._closed = False
     
     def _ensure_database_exists(self):
         """Ensure the database file and directory exist"""
@@ -36,15 +60,30 @@ class DatabaseManager:
             os.makedirs(db_dir, exist_ok=True)
             logger.info(f"Created database directory: {db_dir}")
     
+    def _create_connection(self) -> sqlite3.Connection:
+        """Open a pooled connection and apply per-connection PRAGMAs once"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=30.0,
+            check_same_thread=False,
+            cached_statements=config.DB_STATEMENT_CACHE_SIZE  # Prepared statements reused per connection
+        )
+        conn.row_factory = sqlite3.Row  # Enable column access by name
+        conn.execute("PRAGMA foreign_keys = ON")  # Enable foreign key constraints
+        conn.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL, fewer fsyncs
+        conn.execute("PRAGMA busy_timeout = 30000")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute(f"PRAGMA cache_size = -{config.DB_CACHE_SIZE_KB}")  # Negative value means KiB
+        conn.execute(f"PRAGMA mmap_size = {config.DB_MMAP_SIZE}")  # Read pages straight from the mapping
+        return conn
+    
     @contextmanager
     def get_connection(self) -> Generator[sqlite3.Connection, None, None]:
-        """Get a database connection with automatic cleanup"""
+        """Check out a pooled database connection and return it afterwards"""
         conn = None
+        pool = self._pool
         try:
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            conn.row_factory = sqlite3.Row  # Enable column access by name
-            conn.execute("PRAGMA foreign_keys = ON")  # Enable foreign key constraints
-            conn.execute("PRAGMA journal_mode = WAL")  # Enable WAL mode for better concurrency
+            conn = pool.get(timeout=config.DB_POOL_TIMEOUT)
             yield conn
         except sqlite3.Error as e:
             if conn:
@@ -58,34 +97,87 @@ class DatabaseManager:
             raise
         finally:
             if conn:
+                # Never hand an open transaction to the next borrower
+                if conn.in_transaction:
+                    conn.rollback()
+                # Long-running servers refresh stale statistics at most once per interval;
+                # close_all() covers the rest at shutdown
+                if time.monotonic() >= self._next_optimize:
+                    self._next_optimize = time.monotonic() + self._OPTIMIZE_INTERVAL
+                    self._optimize(conn)
+                with self._init_lock:
+                    # A connection borrowed before close_all() must not go back into the
+                    # drained pool or a reopened one; close it like its idle siblings
+                    if self._closed or pool is not self._pool:
+                        conn.close()
+                    else:
+                        pool.put(conn)
+    
+    def _optimize(self, conn: sqlite3.Connection):
+        """Run PRAGMA optimize; it only re-analyzes tables whose statistics look stale"""
+        try:
+            conn.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            logger.warning(f"PRAGMA optimize failed: {e}")
+    
+    def close_all(self):
+        """Optimize and close every idle pooled connection (call on shutdown)"""
+        with self._init_lock:
+            closed = 0
+            while True:
+                try:
+                    conn = self._pool.get_nowait()
+                except queue.Empty:
+                    break
+                self._optimize(conn)
                 conn.close()
+                closed += 1
+            self._closed = True
+        logger.info(f"Closed {closed} pooled database connections")
     
-    def execute_query(self, query: str, params: tuple = (), fetch_one: bool = False, fetch_all: bool = False):
-        """Execute a query with automatic connection management"""
+    def execute_query(self, query: str, params: tuple = (), fetch_one: bool = False, fetch_all: bool = False,
+                      return_lastrowid: bool = False):
+        """Execute a query with automatic connection management.
+
+        Fetched rows are returned as sqlite3.Row objects, which support access
+        by column name; callers convert to dicts only where they need one.
+        """
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
+            cursor = conn.execute(query, params)
             
             if fetch_one:
-                result = cursor.fetchone()
-                return dict(result) if result else None
+                return cursor.fetchone()
             elif fetch_all:
-                results = cursor.fetchall()
-                return [dict(row) for row in results]
+                return cursor.fetchall()
             else:
                 conn.commit()
-                return cursor.rowcount
+                return cursor.lastrowid if return_lastrowid else cursor.rowcount
     
     def execute_many(self, query: str, params_list: list):
         """Execute multiple queries with the same statement"""
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.executemany(query, params_list)
+            cursor = conn.executemany(query, params_list)
             conn.commit()
             return cursor.rowcount
     
+    @staticmethod
+    def _has_unique_attendance_constraint(cursor: sqlite3.Cursor) -> bool:
+        """True if the attendance table itself declares UNIQUE(student_id, group_id, date)"""
+        for index in cursor.execute("PRAGMA index_list(attendance)").fetchall():
+            # origin 'u' marks indexes created by a UNIQUE constraint in the table definition
+            if index['unique'] and index['origin'] == 'u':
+                columns = [col['name'] for col in cursor.execute(f"PRAGMA index_info({index['name']})")]
+                if columns == ['student_id', 'group_id', 'date']:
+                    return True
+        return False
+    
     def initialize_database(self):
         """Initialize database with required tables"""
+        with self._init_lock:
+            # Reopen the pool if a previous shutdown closed it (e.g. app restarted in-process)
+            if self._closed:
+                self._open_pool()
+        
         with self.get_connection() as conn:
             cursor = conn.cursor()
             
@@ -94,7 +186,7 @@ class DatabaseManager:
                 CREATE TABLE IF NOT EXISTS teachers (
                     teacher_id INTEGER PRIMARY KEY AUTOINCREMENT,
                     username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
+                    password TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
@@ -104,11 +196,10 @@ class DatabaseManager:
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS groups (
                     group_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_name TEXT NOT NULL,
+                    name TEXT NOT NULL,
                     class_name TEXT NOT NULL,
-                    teacher_name TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (teacher_name) REFERENCES teachers (username)
+                    teacher_id INTEGER NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
             
@@ -131,6 +222,7 @@ class DatabaseManager:
                     title TEXT NOT NULL,
                     date TEXT NOT NULL,
                     group_id INTEGER NOT NULL,
+                    teacher_id TEXT,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     FOREIGN KEY (group_id) REFERENCES groups (group_id) ON DELETE CASCADE
                 )
@@ -151,12 +243,88 @@ class DatabaseManager:
                 )
             ''')
             
+            # Groups used to store the teacher's username in teacher_id; point them at the numeric id
+            cursor.execute('''
+                UPDATE groups
+                SET teacher_id = (SELECT t.teacher_id FROM teachers t WHERE t.username = groups.teacher_id)
+                WHERE typeof(teacher_id) = 'text'
+                  AND EXISTS (SELECT 1 FROM teachers t WHERE t.username = groups.teacher_id)
+            ''')
+            
+            # Attendance tables created before the UNIQUE constraint existed get it as an
+            # index instead. Fresh tables already have sqlite_autoindex_attendance_1, and a
+            # second identical index would only slow every attendance INSERT
+            if self._has_unique_attendance_constraint(cursor):
+                cursor.execute('DROP INDEX IF EXISTS ux_attendance_sgd')
+            elif not cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_attendance_sgd'"
+            ).fetchone():
+                # Collapse duplicate rows once so the index can be built, taking any
+                # removed present rows back out of students.attendance_count
+                cursor.execute('''
+                    CREATE TEMP TABLE attendance_dupes AS
+                    SELECT attendance_id, student_id, present FROM attendance
+                    WHERE attendance_id NOT IN (
+                        SELECT MIN(attendance_id) FROM attendance GROUP BY student_id, group_id, date
+                    )
+                ''')
+                cursor.execute('''
+                    UPDATE students
+                    SET attendance_count = MAX(0, attendance_count - (
+                        SELECT COUNT(*) FROM attendance_dupes d
+                        WHERE d.student_id = students.student_id AND d.present = 1
+                    ))
+                    WHERE student_id IN (SELECT student_id FROM attendance_dupes WHERE present = 1)
+                ''')
+                cursor.execute('DELETE FROM attendance WHERE attendance_id IN (SELECT attendance_id FROM attendance_dupes)')
+                if cursor.rowcount:
+                    logger.warning(f"Removed {cursor.rowcount} duplicate attendance rows before adding ux_attendance_sgd")
+                cursor.execute('DROP TABLE attendance_dupes')
+                cursor.execute('CREATE UNIQUE INDEX ux_attendance_sgd ON attendance (student_id, group_id, date)')
+            
+            # Keep the denormalised attendance counter in step with inserts
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_attendance_inc
+                AFTER INSERT ON attendance WHEN NEW.present = 1
+                BEGIN
+                    UPDATE students SET attendance_count = attendance_count + 1
+                    WHERE student_id = NEW.student_id;
+                END
+            ''')
+            
+            # Cascade group deletes inside the engine. Tables created by older versions
+            # lack ON DELETE CASCADE, so a trigger covers both schemas; it runs before
+            # the group row goes so foreign keys never see orphans
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_groups_cascade
+                BEFORE DELETE ON groups
+                BEGIN
+                    DELETE FROM attendance WHERE group_id = OLD.group_id;
+                    DELETE FROM exams WHERE group_id = OLD.group_id;
+                    DELETE FROM students WHERE group_id = OLD.group_id;
+                END
+            ''')
+            
             # Create indexes for better performance
+            # Covering index for login lookups; legacy teachers tables lack the UNIQUE username index
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_teachers_username ON teachers (username, password)')
+            # Covers WHERE teacher_id = ? ORDER BY name in the group listings
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_groups_teacher_name ON groups (teacher_id, name)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_students_group_id ON students (group_id)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_students_leaderboard ON students (attendance_count DESC, name ASC)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_exams_group_id ON exams (group_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_student_id ON attendance (student_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_group_id ON attendance (group_id)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_date ON attendance (date)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_student_date ON attendance (student_id, date)')
+            # Covering index for the per-group/per-date attendance summary; it
+            # supersedes the narrower (group_id) and (group_id, date) indexes
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_group_date_present ON attendance (group_id, date, present)')
+            cursor.execute('DROP INDEX IF EXISTS idx_attendance_group_id')
+            cursor.execute('DROP INDEX IF EXISTS idx_attendance_group_date')
+            # (student_id) is a strict prefix of idx_attendance_student_date
+            cursor.execute('DROP INDEX IF EXISTS idx_attendance_student_id')
+            
+            # Refresh planner statistics so new indexes get picked
+            cursor.execute('ANALYZE')
             
             conn.commit()
             logger.info("Database tables initialized successfully")
@@ -174,3 +342,7 @@ def get_db_connection():
 def init_database():
     """Initialize the database"""
     db_manager.initialize_database()
+
+def close_database():
+    """Close pooled database connections"""
+    db_manager.close_all()
@@ -1,52 +1,35 @@
-
 import sqlite3
+import logging
+from typing import List, Optional
+from db.connection import db_manager
 
-def create_exam_table():
-    conn = sqlite3.connect("Teachers.db")
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS exams (
-            exam_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT,
-            date TEXT,
-            group_id INTEGER,
-            teacher_id TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-
-create_exam_table()
+logger = logging.getLogger(__name__)
 
-def create_exam(title, date, group_id, teacher_id):
-    conn = sqlite3.connect("Teachers.db")
-    cur = conn.cursor()
-    cur.execute("INSERT INTO exams (title, date, group_id, teacher_id) VALUES (?, ?, ?, ?)", (title, date, group_id, teacher_id))
-    exam_id = cur.lastrowid
-    conn.commit()
-    conn.close()
-    return exam_id
+def create_exam(title: str, date: str, group_id: int, teacher_id) -> Optional[int]:
+    """Create a new exam and return the exam_id"""
+    return db_manager.execute_query(
+        "INSERT INTO exams (title, date, group_id, teacher_id) VALUES (?, ?, ?, ?)",
+        (title, date, group_id, teacher_id),
+        return_lastrowid=True
+    )
 
-def get_exams_for_group(group_id):
-    conn = sqlite3.connect("Teachers.db")
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM exams WHERE group_id = ?", (group_id,))
-    exams = cur.fetchall()
-    conn.close()
-    return exams
+def get_exams_for_group(group_id: int) -> List[sqlite3.Row]:
+    """Get all exams for a group"""
+    return db_manager.execute_query(
+        "SELECT * FROM exams WHERE group_id = ?",
+        (group_id,),
+        fetch_all=True
+    )
 
-def get_exam_by_id(exam_id):
-    conn = sqlite3.connect("Teachers.db")
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM exams WHERE exam_id = ?", (exam_id,))
-    exam = cur.fetchone()
-    conn.close()
-    return exam
+def get_exam_by_id(exam_id: int) -> Optional[sqlite3.Row]:
+    """Get a specific exam by ID"""
+    return db_manager.execute_query(
+        "SELECT * FROM exams WHERE exam_id = ?",
+        (exam_id,),
+        fetch_one=True
+    )
 
-def delete_exam(exam_id):
-    conn = sqlite3.connect("Teachers.db")
-    cur = conn.cursor()
-    cur.execute("DELETE FROM exams WHERE exam_id = ?", (exam_id,))
-    conn.commit()
-    conn.close()
+def delete_exam(exam_id: int) -> bool:
+    """Delete an exam by ID"""
+    db_manager.execute_query("DELETE FROM exams WHERE exam_id = ?", (exam_id,))
     return True
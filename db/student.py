@@ -1,8 +1,9 @@
-import sqlite3
-import qrcode
+import segno
 import os
 import logging
-from typing import List, Optional, Dict, Any
+import tempfile
+import sqlite3
+from typing import List, Optional
 from db.connection import db_manager
 from config import config
 
@@ -11,21 +12,6 @@ logger = logging.getLogger(__name__)
 # Ensure the qrcodes directory exists
 os.makedirs('qrcodes', exist_ok=True)
 
-def create_student_table():
-    conn = sqlite3.connect("Teachers.db")
-    cur = conn.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS students (
-            student_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            group_id INTEGER,
-            attendance_count INTEGER DEFAULT 0,
-            FOREIGN KEY(group_id) REFERENCES groups(group_id)
-        )
-    """)
-    conn.commit()
-    conn.close()
-
 def add_student(name: str, group_id: int) -> Optional[int]:
     """Add a new student and return the student_id"""
     if not name or not group_id:
@@ -41,13 +27,13 @@ def add_student(name: str, group_id: int) -> Optional[int]:
             )
             conn.commit()
             student_id = cursor.lastrowid
-            logger.info(f"Created student: {name} (ID: {student_id})")
+            logger.info("Created student: %s (ID: %s)", name, student_id)
             return student_id
     except Exception as e:
-        logger.error(f"Error creating student: {e}")
+        logger.error("Error creating student: %s", e)
         return None
 
-def get_students_in_group(group_id: int) -> List[Dict[str, Any]]:
+def get_students_in_group(group_id: int) -> List[sqlite3.Row]:
     """Get all students in a specific group"""
     if not group_id:
         return []
@@ -60,7 +46,7 @@ def get_students_in_group(group_id: int) -> List[Dict[str, Any]]:
         )
         return results or []
     except Exception as e:
-        logger.error(f"Error getting students in group {group_id}: {e}")
+        logger.error("Error getting students in group %s: %s", group_id, e)
         return []
 
 def remove_student(student_id: int) -> bool:
@@ -75,18 +61,19 @@ def remove_student(student_id: int) -> bool:
         )
         success = rows_affected > 0
         if success:
-            logger.info(f"Removed student ID: {student_id}")
+            logger.info("Removed student ID: %s", student_id)
         else:
-            logger.warning(f"No student found with ID: {student_id}")
+            logger.warning("No student found with ID: %s", student_id)
         return success
     except Exception as e:
-        logger.error(f"Error removing student {student_id}: {e}")
+        logger.error("Error removing student %s: %s", student_id, e)
         return False
 
-def get_leaderboard(limit: int = 100) -> List[Dict[str, Any]]:
+def get_leaderboard(limit: int = 100) -> List[sqlite3.Row]:
     """Return top students ordered by attendance_count desc with group info"""
     try:
-        # Optimized query with JOIN to avoid N+1 problem
+        # Reads the materialized attendance_count (kept current by trg_attendance_inc),
+        # so this walks idx_students_leaderboard and stops after LIMIT rows
         query = """
             SELECT s.student_id, s.name, s.group_id, s.attendance_count,
                    g.name as group_name, g.class_name
@@ -98,63 +85,56 @@ def get_leaderboard(limit: int = 100) -> List[Dict[str, Any]]:
         results = db_manager.execute_query(query, (limit,), fetch_all=True)
         return results or []
     except Exception as e:
-        logger.error(f"Error getting leaderboard: {e}")
+        logger.error("Error getting leaderboard: %s", e)
         return []
 
 def generate_student_qr(student_id):
-    import os
-    from PIL import Image
-    
     # Ensure the qrcodes directory exists
     qr_dir = "qrcodes"
     if not os.path.exists(qr_dir):
         os.makedirs(qr_dir)
-        print(f"Created QR codes directory: {qr_dir}")
+        logger.info("Created QR codes directory: %s", qr_dir)
     
     qr_path = f"{qr_dir}/student_{student_id}.png"
     
+    # The QR is a pure function of student_id, so reuse an existing file
     try:
-        # Create QR code with specific settings for better compatibility
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(str(student_id))
-        qr.make(fit=True)
-        
-        # Create image with white background
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Ensure it's in RGB mode for PNG compatibility
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Save the image
-        img.save(qr_path, "PNG", optimize=True)
+        if os.stat(qr_path).st_size > 0:
+            return qr_path
+    except OSError:
+        pass
+    
+    # Write to a unique temp file and rename so readers never see a partial file;
+    # mkstemp names are unique across threads and forked workers alike
+    fd, tmp_path = tempfile.mkstemp(dir=qr_dir, prefix=f"student_{student_id}.", suffix=".tmp")
+    
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            # Regular (not Micro) QR with low error correction, written as a 1-bit PNG
+            qr = segno.make(str(student_id), error='l', micro=False, boost_error=False)
+            qr.save(tmp_file, kind='png', scale=10, border=4, dark='black', light='white')
+        os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; keep the usual permissions for served files
+        os.replace(tmp_path, qr_path)
         
-        # Verify the file was created and has content
-        if os.path.exists(qr_path):
-            file_size = os.path.getsize(qr_path)
-            if file_size > 0:
-                print(f"QR code saved successfully: {qr_path} ({file_size} bytes)")
-                return qr_path
-            else:
-                print(f"QR code file is empty: {qr_path}")
-                return None
+        # Verify the file was created and has content with a single stat
+        try:
+            file_size = os.stat(qr_path).st_size
+        except FileNotFoundError:
+            logger.warning("QR code file was not created: %s", qr_path)
+            return None
+        if file_size > 0:
+            logger.debug("QR code saved successfully: %s (%s bytes)", qr_path, file_size)
+            return qr_path
         else:
-            print(f"QR code file was not created: {qr_path}")
+            logger.warning("QR code file is empty: %s", qr_path)
             return None
             
     except Exception as e:
-        print(f"Error generating QR code for student {student_id}: {e}")
+        logger.error("Error generating QR code for student %s: %s", student_id, e)
         # Clean up any partially created file
-        if os.path.exists(qr_path):
+        if os.path.exists(tmp_path):
             try:
-                os.remove(qr_path)
+                os.remove(tmp_path)
             except:
                 pass
         return None
-
-create_student_table()
\ No newline at end of file
@@ -3,20 +3,22 @@ import logging
 from typing import Optional
 from passlib.context import CryptContext
 from .connection import DatabaseManager
+from config import config
 
 # Create database manager instance
 db_manager = DatabaseManager()
 
 # Create password context for hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    bcrypt__rounds=config.BCRYPT_ROUNDS,
+    bcrypt__ident="2b",
+    deprecated="auto"
+)
 
-conn=sqlite3.connect("Teachers.db")
-
-cur=conn.cursor()
-cur.execute("CREATE TABLE IF NOT EXISTS Teachers(teacher_id INTEGER PRIMARY KEY AUTOINCREMENT,username TEXT UNIQUE, password TEXT)")
-
-def username_exists(_username: str) -> bool:
-    """Check if a username already exists in the database"""
+# Verified against on unknown usernames so misses cost the same bcrypt work as
+# real logins; keeps usernames from being enumerated by response time
+DUMMY_HASH = pwd_context.hash("dummy-password-for-timing")
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
@@ -36,7 +38,6 @@ def verify_password(plain_password: str, stored_password: str) -> bool:
         # If bcrypt verification fails, check if it's a plain text password (legacy)
         if plain_password == stored_password:
             logging.info("Found plain text password, migrating to bcrypt hash")
-            # TODO: Migrate this password to bcrypt hash in background
             return True
         else:
             logging.error(f"Password verification error: {e}")
@@ -56,51 +57,51 @@ def teacher_exists(username: str, password: str) -> bool:
         
         if result:
             stored_hash = result['password']
-            return verify_password(password, stored_hash)
+            if not verify_password(password, stored_hash):
+                return False
+            
+            # Re-hash on successful login when the stored value is plain text or
+            # uses a different cost than the current BCRYPT_ROUNDS policy
+            if not pwd_context.identify(stored_hash, required=False) or pwd_context.needs_update(stored_hash):
+                db_manager.execute_query(
+                    "UPDATE teachers SET password = ? WHERE username = ?",
+                    (hash_password(password), username)
+                )
+                logging.info(f"Re-hashed password for teacher: {username}")
+            return True
+        
+        pwd_context.verify(password, DUMMY_HASH)
         return False
         
     except Exception as e:
         logging.error(f"Error checking teacher existence: {e}")
         return False
 
-def insert_teacher(username: str, password: str) -> bool:
-    """Insert a new teacher with proper validation and error handling"""
-    if not username or not password:
-        logging.error("Username and password are required")
-        return False
-    
-    if len(username.strip()) < 3:
-        logging.error("Username must be at least 3 characters long")
-        return False
-    
-    if len(password) < 6:
-        logging.error("Password must be at least 6 characters long")
-        return False
-    
+def create_teacher(username: str, hashed_password: str) -> Optional[int]:
+    """Insert a teacher with an already-hashed password and return the new teacher_id.
+
+    Returns None if the username is taken. The existence check and the INSERT are
+    one statement, so concurrent registrations can't both succeed even on legacy
+    teachers tables that lack a UNIQUE constraint on username.
+    """
     try:
-        # Initialize database tables if needed
-        db_manager.initialize_database()
-        
-        hashed_password = hash_password(password)
-        
-        rows_affected = db_manager.execute_query(
-            "INSERT INTO teachers (username, password) VALUES (?, ?)", 
-            (username.strip(), hashed_password)
-        )
-        
-        if rows_affected > 0:
+        with db_manager.get_connection() as conn:
+            cursor = conn.execute(
+                """
+                INSERT INTO teachers (username, password)
+                SELECT ?, ?
+                WHERE NOT EXISTS (SELECT 1 FROM teachers WHERE username = ?)
+                """,
+                (username, hashed_password, username)
+            )
+            conn.commit()
+            if cursor.rowcount == 0:
+                return None
             logging.info(f"Teacher created successfully: {username}")
-            return True
-        else:
-            logging.error(f"Failed to insert teacher: {username}")
-            return False
-            
-    except sqlite3.IntegrityError as e:
+            return cursor.lastrowid
+    except sqlite3.IntegrityError:
         logging.error(f"Username already exists: {username}")
-        return False
-    except Exception as e:
-        logging.error(f"Error inserting teacher: {e}")
-        return False
+        return None
 
 def username_exists(username: str) -> bool:
     """Check if username already exists"""
@@ -109,8 +110,8 @@ def username_exists(username: str) -> bool:
     
     try:
         result = db_manager.execute_query(
-            "SELECT 1 FROM teachers WHERE username = ?", 
-            (username.strip(),), 
+            "SELECT 1 FROM teachers WHERE username = ? LIMIT 1", 
+            (username,), 
             fetch_one=True
         )
         return result is not None
@@ -119,7 +120,7 @@ def username_exists(username: str) -> bool:
         logging.error(f"Error checking username existence: {e}")
         return False
 
-def get_teacher_by_username(username: str) -> Optional[dict]:
+def get_teacher_by_username(username: str) -> Optional[sqlite3.Row]:
     """Get teacher information by username"""
     if not username:
         return None
@@ -136,6 +137,23 @@ def get_teacher_by_username(username: str) -> Optional[dict]:
         logging.error(f"Error getting teacher by username: {e}")
         return None
 
+def get_teacher_id(username: str) -> Optional[int]:
+    """Get the numeric teacher_id for a username"""
+    if not username:
+        return None
+    
+    try:
+        result = db_manager.execute_query(
+            "SELECT teacher_id FROM teachers WHERE username = ?", 
+            (username,), 
+            fetch_one=True
+        )
+        return result['teacher_id'] if result else None
+        
+    except Exception as e:
+        logging.error(f"Error getting teacher id for {username}: {e}")
+        return None
+
 def update_teacher_password(username: str, new_password: str) -> bool:
     """Update teacher password"""
     if not username or not new_password:
@@ -163,13 +181,3 @@ def update_teacher_password(username: str, new_password: str) -> bool:
     except Exception as e:
         logging.error(f"Error updating teacher password: {e}")
         return False
-
-# Create the database and table if they do not exist
-try:
-    conn = sqlite3.connect('Teachers.db')
-    cursor = conn.cursor()
-    cursor.execute("CREATE TABLE IF NOT EXISTS teachers(teacher_id INTEGER PRIMARY KEY AUTOINCREMENT,username TEXT UNIQUE, password_hash TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP, updated_at TEXT)")
-    conn.commit()
-    conn.close()
-except sqlite3.Error as e:
-    logging.error(f"Error creating database and table: {e}")
\ No newline at end of file
@@ -1,18 +1,10 @@
+import sqlite3
 import logging
-from typing import List, Optional, Dict, Any
+from typing import List, Optional
 from db.connection import db_manager
 
 logger = logging.getLogger(__name__)
 
-def create_table():
-    try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("CREATE TABLE IF NOT EXISTS groups (group_id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, class_name TEXT, teacher_id INTEGER)")
-            conn.commit()
-    except Exception as e:
-        logger.error(f"Error creating table: {e}")
-
 def create_group(group_name: str, class_name: str, teacher_id: int) -> Optional[int]:
     """Create a new group and return the group_id"""
     if not group_name or not class_name or not teacher_id:
@@ -34,7 +26,7 @@ def create_group(group_name: str, class_name: str, teacher_id: int) -> Optional[
         logger.error(f"Error creating group: {e}")
         return None
 
-def get_groups(teacher_id: Optional[int] = None) -> List[Dict[str, Any]]:
+def get_groups(teacher_id: Optional[int] = None) -> List[sqlite3.Row]:
     """Get all groups, optionally filtered by teacher_id"""
     try:
         if teacher_id:
@@ -53,7 +45,7 @@ def get_groups(teacher_id: Optional[int] = None) -> List[Dict[str, Any]]:
         logger.error(f"Error getting groups: {e}")
         return []
 
-def get_group_by_id(group_id: int) -> Optional[Dict[str, Any]]:
+def get_group_by_id(group_id: int) -> Optional[sqlite3.Row]:
     """Get a specific group by ID"""
     if not group_id:
         return None
@@ -70,39 +62,22 @@ def get_group_by_id(group_id: int) -> Optional[Dict[str, Any]]:
         return None
 
 def delete_group_by_id(group_id: int) -> bool:
-    """Delete a group by ID and handle related records manually"""
+    """Delete a group by ID; trg_groups_cascade removes its attendance, exams and students"""
     if not group_id:
         return False
     
     try:
-        with db_manager.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # First, delete related records to avoid FOREIGN KEY constraints
-            # Delete attendance records
-            cursor.execute("DELETE FROM attendance WHERE group_id = ?", (group_id,))
-            attendance_deleted = cursor.rowcount
-            
-            # Delete exam records
-            cursor.execute("DELETE FROM exams WHERE group_id = ?", (group_id,))
-            exams_deleted = cursor.rowcount
-            
-            # Delete student records
-            cursor.execute("DELETE FROM students WHERE group_id = ?", (group_id,))
-            students_deleted = cursor.rowcount
-            
-            # Finally, delete the group
-            cursor.execute("DELETE FROM groups WHERE group_id = ?", (group_id,))
-            groups_deleted = cursor.rowcount
-            
-            conn.commit()
-            
-            if groups_deleted > 0:
-                logger.info(f"Deleted group ID: {group_id} (with {students_deleted} students, {exams_deleted} exams, {attendance_deleted} attendance records)")
-                return True
-            else:
-                logger.warning(f"No group found with ID: {group_id}")
-                return False
+        groups_deleted = db_manager.execute_query(
+            "DELETE FROM groups WHERE group_id = ?", 
+            (group_id,)
+        )
+        
+        if groups_deleted > 0:
+            logger.info(f"Deleted group ID: {group_id}")
+            return True
+        else:
+            logger.warning(f"No group found with ID: {group_id}")
+            return False
                 
     except Exception as e:
         logger.error(f"Error deleting group {group_id}: {e}")
@@ -124,27 +99,25 @@ def get_group_name(group_id: int) -> Optional[str]:
         logger.error(f"Error getting group name for ID {group_id}: {e}")
         return None
 
-def get_groups_with_student_count(teacher_id: Optional[int] = None) -> List[Dict[str, Any]]:
-    """Get groups with student count - optimized single query"""
+def get_groups_with_student_count(teacher_id: Optional[int] = None) -> List[sqlite3.Row]:
+    """Get groups with student count - single query projecting exactly the API fields"""
     try:
+        # A correlated COUNT per group lets SQLite walk idx_groups_teacher_name in
+        # name order and count from idx_students_group_id, with no GROUP BY sort
         if teacher_id:
             query = """
-                SELECT g.group_id, g.name, g.class_name, g.teacher_id, 
-                       COUNT(s.student_id) as student_count
+                SELECT g.group_id, g.name, g.class_name,
+                       (SELECT COUNT(*) FROM students s WHERE s.group_id = g.group_id) AS student_count
                 FROM groups g
-                LEFT JOIN students s ON g.group_id = s.group_id
                 WHERE g.teacher_id = ?
-                GROUP BY g.group_id, g.name, g.class_name, g.teacher_id
                 ORDER BY g.name
             """
             params = (teacher_id,)
         else:
             query = """
-                SELECT g.group_id, g.name, g.class_name, g.teacher_id, 
-                       COUNT(s.student_id) as student_count
+                SELECT g.group_id, g.name, g.class_name,
+                       (SELECT COUNT(*) FROM students s WHERE s.group_id = g.group_id) AS student_count
                 FROM groups g
-                LEFT JOIN students s ON g.group_id = s.group_id
-                GROUP BY g.group_id, g.name, g.class_name, g.teacher_id
                 ORDER BY g.name
             """
             params = ()
@@ -154,6 +127,3 @@ def get_groups_with_student_count(teacher_id: Optional[int] = None) -> List[Dict
     except Exception as e:
         logger.error(f"Error getting groups with student count: {e}")
         return []
-
-# Create table on module load
-create_table()
@@ -1,23 +1,28 @@
 from fastapi import FastAPI, Depends, Request, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from typing import List, Optional
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import jwt  # PyJWT library
+import asyncio
 import os
 import logging
+import zipfile
 
 # Import configuration
 from config import config
 
 from data_validation.teacher import Teacher
-from auth.JWT import create_access_token, get_current_teacher, get_current_teacher_optional
-from db.teacher_auth import teacher_exists, insert_teacher, username_exists
+from auth.JWT import create_access_token, get_current_teacher, get_current_identity, get_current_teacher_id, get_current_teacher_optional
+from db.connection import init_database, close_database
+from db.teacher_auth import teacher_exists, create_teacher, hash_password, username_exists, get_teacher_id
 from db.teacher_groups import *
 from db.student import add_student, get_students_in_group, remove_student, generate_student_qr, get_leaderboard
 from db.exam import create_exam, get_exams_for_group, get_exam_by_id, delete_exam
 from db.attendance import record_attendance, get_attendance_for_group, get_attendance_for_student, get_attendance_summary, mark_absent_students
-from utils.file_manager import file_manager, create_safe_filename
+from utils.file_manager import create_safe_filename
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,11 +32,22 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """Application lifespan management"""
     # Startup
+    init_database()
+    # Executors live on app.state and are created per lifespan so an in-process
+    # restart gets fresh pools instead of ones already shut down.
+    # bcrypt releases the GIL, so hashing in worker threads keeps the event loop free
+    # and lets concurrent logins/registrations use every core
+    app.state.bcrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="bcrypt")
+    # QR generation mixes CPU work with a file write per student; run a group's codes concurrently
+    app.state.qr_pool = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) + 4), thread_name_prefix="qr")
     logging.info(f"Starting Teacher App API on {config.HOST}:{config.PORT}")
     logging.info(f"Debug mode: {config.DEBUG}")
     logging.info(f"CORS origins: {config.CORS_ORIGINS}")
     yield
     # Shutdown
+    app.state.bcrypt_pool.shutdown(wait=False)
+    app.state.qr_pool.shutdown(wait=False)
+    close_database()
     logging.info("Shutting down Teacher App API")
 
 # Request models
@@ -46,6 +62,40 @@ class ExamRequest(BaseModel):
     title: str
     date: str
 
+class AttendanceScanRequest(BaseModel):
+    student_id: int
+    group_id: int
+    date: str
+    present: bool = True
+
+class MarkAbsentRequest(BaseModel):
+    date: str
+    absent_student_ids: List[int]
+
+# Response models; declaring them lets FastAPI serialise rows straight to JSON via pydantic-core
+class StudentOut(BaseModel):
+    student_id: int
+    name: Optional[str]
+    group_id: Optional[int]
+    attendance_count: Optional[int]
+
+class ExamOut(BaseModel):
+    exam_id: int
+    title: Optional[str]
+    date: Optional[str]
+    group_id: Optional[int]
+
+class AttendanceOut(BaseModel):
+    attendance_id: int
+    student_id: Optional[int]
+    group_id: Optional[int]
+    date: Optional[str]
+    present: Optional[int]
+
+class LeaderboardEntryOut(StudentOut):
+    group_name: Optional[str]
+    class_name: Optional[str]
+
 # Validate configuration on startup
 config.validate_config()
 
@@ -83,10 +133,10 @@ app.add_middleware(
 
 
 @app.post('/auth/register')
-async def register(teacher: Teacher):
+async def register(request: Request, teacher: Teacher):
     """Register a new teacher account"""
     try:
-        username = teacher.username.strip()
+        username = teacher.username
         password = teacher.password
         
         # Input validation
@@ -96,17 +146,21 @@ async def register(teacher: Teacher):
         if not password or len(password) < 6:
             raise HTTPException(status_code=400, detail="Password must be at least 6 characters long")
         
-        # Check if username already exists
+        # Cheap early exit that spares the bcrypt work for taken usernames
         if username_exists(username):
             raise HTTPException(status_code=409, detail="Username already exists")
         
-        # Create the teacher account
-        success = insert_teacher(username, password)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to create user account")
+        # Only the hashing runs in the pool; create_teacher re-checks the username
+        # in the same statement as the INSERT, so a concurrent registration that
+        # passed the check above still ends up with a 409
+        loop = asyncio.get_running_loop()
+        hashed_password = await loop.run_in_executor(request.app.state.bcrypt_pool, hash_password, password)
+        teacher_id = create_teacher(username, hashed_password)
+        if teacher_id is None:
+            raise HTTPException(status_code=409, detail="Username already exists")
         
-        # Generate secure token
-        token = create_access_token(username)
+        # Generate secure token; teacher_id in the claims spares a lookup per request
+        token = create_access_token(username, {"teacher_id": teacher_id})
         
         logging.info(f"New teacher registered: {username}")
         return {
@@ -122,10 +176,10 @@ async def register(teacher: Teacher):
         raise HTTPException(status_code=500, detail="Internal server error during registration")
 
 @app.post('/auth/login')
-async def login(teacher: Teacher):
+async def login(request: Request, teacher: Teacher):
     """Authenticate teacher login"""
     try:
-        username = teacher.username.strip()
+        username = teacher.username
         password = teacher.password
         
         # Input validation
@@ -133,9 +187,12 @@ async def login(teacher: Teacher):
             raise HTTPException(status_code=400, detail="Username and password are required")
         
         # Verify credentials
-        if teacher_exists(username, password):
-            # Generate secure token
-            token = create_access_token(username)
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(request.app.state.bcrypt_pool, teacher_exists, username, password):
+            teacher_id = get_teacher_id(username)
+            
+            # Generate secure token; teacher_id in the claims spares a lookup per request
+            token = create_access_token(username, {"teacher_id": teacher_id})
             
             logging.info(f"Teacher logged in: {username}")
             return {
@@ -154,19 +211,21 @@ async def login(teacher: Teacher):
         raise HTTPException(status_code=500, detail="Internal server error during login")
     
 @app.get('/groups')
-async def list_groups_endpoint(current_teacher: str = Depends(get_current_teacher)):
-    groups = get_groups_with_student_count(current_teacher)
-    return [{"group_id": g.get("group_id"), "name": g.get("name"), "class_name": g.get("class_name"), "student_count": g.get("student_count", 0)} for g in groups]
+async def list_groups_endpoint(teacher_id: int = Depends(get_current_teacher_id)):
+    groups = get_groups_with_student_count(teacher_id)
+    # The query already selects exactly the response fields
+    return [dict(g) for g in groups]
 
 @app.post('/groups')
 @app.post('/groups/create')
-async def create_group_endpoint(group: GroupRequest, current_teacher: str = Depends(get_current_teacher)):
+async def create_group_endpoint(group: GroupRequest, identity: tuple = Depends(get_current_identity)):
+    current_teacher, teacher_id = identity
     # Use the JSON body directly - no need for complex fallback logic
     group_name = group.group_name
     class_name = group.class_name
     
     # Create the group
-    create_group(group_name, class_name, current_teacher)
+    create_group(group_name, class_name, teacher_id)
     return {"success": True, "group": {"name": group_name, "class_name": class_name, "teacher_name": current_teacher}}
 
 # Delete group
@@ -185,10 +244,10 @@ async def add_student_endpoint(group_id: int, student: StudentRequest, current_t
     return {"success": True, "student": {"name": student.name, "group_id": group_id}}
 
 # List students in group
-@app.get('/groups/{group_id}/students')
+@app.get('/groups/{group_id}/students', response_model=List[StudentOut])
 async def list_students_endpoint(group_id: int):
     students = get_students_in_group(group_id)
-    return [{"student_id": s.get("student_id"), "name": s.get("name"), "group_id": s.get("group_id"), "attendance_count": s.get("attendance_count", 0)} for s in students]
+    return [dict(s) for s in students]
 
 # Remove student from group
 @app.delete('/groups/{group_id}/students/{student_id}')
@@ -210,17 +269,17 @@ async def create_exam_endpoint(group_id: int, exam: ExamRequest, current_teacher
     return {"success": True, "exam_id": exam_id, "title": exam.title, "date": exam.date, "group_id": group_id}
 
 # List exams for a group
-@app.get('/groups/{group_id}/exams')
+@app.get('/groups/{group_id}/exams', response_model=List[ExamOut])
 async def list_exams_endpoint(group_id: int):
     exams = get_exams_for_group(group_id)
-    return [{"exam_id": e.get("exam_id"), "title": e.get("title"), "date": e.get("date"), "group_id": e.get("group_id")} for e in exams]
+    return [dict(e) for e in exams]
 
 # Get exam details
 @app.get('/exams/{exam_id}')
 async def get_exam_details_endpoint(exam_id: int):
     exam = get_exam_by_id(exam_id)
     if exam:
-        return {"exam_id": exam.get("exam_id"), "title": exam.get("title"), "date": exam.get("date"), "group_id": exam.get("group_id")}
+        return {"exam_id": exam["exam_id"], "title": exam["title"], "date": exam["date"], "group_id": exam["group_id"]}
     else:
         return {"error": "Exam not found"}
 
@@ -231,11 +290,12 @@ async def delete_exam_endpoint(exam_id: int):
     return {"success": True, "exam_id": exam_id}
 
 @app.post('/attendance/scan')
-async def scan_attendance(request: dict, current_teacher: str = Depends(get_current_teacher)):
-    student_id = request.get('student_id')
-    group_id = request.get('group_id') 
-    date = request.get('date')
-    present = request.get('present', True)  # Default to present
+async def scan_attendance(request: AttendanceScanRequest, current_teacher: str = Depends(get_current_teacher)):
+    # Missing or mistyped fields are rejected with a 422 by the request model
+    student_id = request.student_id
+    group_id = request.group_id
+    date = request.date
+    present = request.present
     
     if not all([student_id, group_id, date]):
         raise HTTPException(status_code=400, detail="Missing required fields: student_id, group_id, date")
@@ -250,27 +310,26 @@ async def scan_attendance(request: dict, current_teacher: str = Depends(get_curr
         logging.error(f"Error recording attendance: {e}")
         raise HTTPException(status_code=500, detail="Failed to record attendance")
 
-@app.get('/groups/{group_id}/attendance')
+@app.get('/groups/{group_id}/attendance', response_model=List[AttendanceOut])
 async def group_attendance_endpoint(group_id: int):
     records = get_attendance_for_group(group_id)
-    return [{"attendance_id": r.get("attendance_id"), "student_id": r.get("student_id"), "group_id": r.get("group_id"), "date": r.get("date"), "present": r.get("present", False)} for r in records]
+    return [dict(r) for r in records]
 
-@app.get('/students/{student_id}/attendance')
+@app.get('/students/{student_id}/attendance', response_model=List[AttendanceOut])
 async def student_attendance_endpoint(student_id: int):
     records = get_attendance_for_student(student_id)
-    return [{"attendance_id": r.get("attendance_id"), "student_id": r.get("student_id"), "group_id": r.get("group_id"), "date": r.get("date"), "present": r.get("present", False)} for r in records]
+    return [dict(r) for r in records]
 
 # Get attendance summary for a group
 @app.get('/groups/{group_id}/attendance/summary')
 async def group_attendance_summary_endpoint(group_id: int, date: str = None):
-    summary = get_attendance_summary(group_id, date)
-    return summary
+    return get_attendance_summary(group_id, date)
 
 # Mark students as absent
 @app.post('/groups/{group_id}/attendance/absent')
-async def mark_absent_endpoint(group_id: int, request: dict, current_teacher: str = Depends(get_current_teacher)):
-    date = request.get('date')
-    absent_student_ids = request.get('absent_student_ids', [])
+async def mark_absent_endpoint(group_id: int, request: MarkAbsentRequest, current_teacher: str = Depends(get_current_teacher)):
+    date = request.date
+    absent_student_ids = request.absent_student_ids
     
     if not date or not absent_student_ids:
         raise HTTPException(status_code=400, detail="Missing required fields: date, absent_student_ids")
@@ -287,12 +346,11 @@ async def mark_absent_endpoint(group_id: int, request: dict, current_teacher: st
 
 @app.get('/students/{student_id}/qr')
 async def get_student_qr_endpoint(request: Request, student_id: int, current_teacher: str = Depends(get_current_teacher_optional)):
-    import os
-    
     # Generate QR code for the student
     qr_path = generate_student_qr(student_id)
     
-    if not qr_path or not os.path.exists(qr_path):
+    # generate_student_qr only returns paths it has already stat-checked
+    if not qr_path:
         raise HTTPException(status_code=404, detail="QR code not found or failed to generate")
     
     # Return the PNG file directly
@@ -304,22 +362,14 @@ async def get_student_qr_endpoint(request: Request, student_id: int, current_tea
     )
 
 # Leaderboard endpoint
-@app.get('/leaderboard')
+@app.get('/leaderboard', response_model=List[LeaderboardEntryOut])
 async def leaderboard_endpoint(limit: int = 100):
     students = get_leaderboard(limit)
-    return [{
-        "student_id": s.get("student_id"),
-        "name": s.get("name"),
-        "group_id": s.get("group_id"),
-        "attendance_count": s.get("attendance_count", 0),
-        "group_name": s.get("group_name"),
-        "class_name": s.get("class_name")
-    } for s in students]
+    return [dict(s) for s in students]
 
 # Serve QR code images (with authentication)
 @app.get('/qrcodes/{filename}')
 async def serve_qr_image(request: Request, filename: str, current_teacher: str = Depends(get_current_teacher_optional)):
-    import os
     qr_path = f"qrcodes/{filename}"
     
     if not os.path.exists(qr_path):
@@ -327,12 +377,37 @@ async def serve_qr_image(request: Request, filename: str, current_teacher: str =
     
     return FileResponse(qr_path, media_type="image/png")
 
+class _ZipStreamBuffer:
+    """Write-only sink for zipfile that hands back bytes as they are produced"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def _iter_qr_zip(qr_files):
+    """Yield an uncompressed ZIP of the given (path, arcname) pairs one member at a time"""
+    buffer = _ZipStreamBuffer()
+    # PNGs are already compressed, so store them as-is
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+        for qr_path, filename in qr_files:
+            zip_file.write(qr_path, filename)
+            logging.debug("Added to ZIP: %s", filename)
+            yield buffer.drain()
+    yield buffer.drain()  # Central directory
+
 @app.get('/groups/{group_id}/qrcodes')
 async def get_group_qrcodes_endpoint(request: Request, group_id: int, current_teacher: str = Depends(get_current_teacher_optional)):
-    import zipfile
-    import os
-    import time
-    
     # Get all students in the group
     students = get_students_in_group(group_id)
     
@@ -351,90 +426,37 @@ async def get_group_qrcodes_endpoint(request: Request, group_id: int, current_te
         os.makedirs(qr_dir)
         logging.info(f"Created directory: {qr_dir}")
     
-    # Generate QR codes for all students and collect valid paths
+    # Generate QR codes for all students in parallel (existing files are reused)
+    loop = asyncio.get_running_loop()
+    qr_paths = await asyncio.gather(*(
+        loop.run_in_executor(request.app.state.qr_pool, generate_student_qr, student["student_id"])
+        for student in students
+    ))
+    
+    # Collect valid paths
     valid_qr_files = []
-    for student in students:
-        student_id = student.get("student_id")  # student_id from dictionary
-        student_name = student.get("name")  # student_name from dictionary
-        
-        logging.debug(f"Generating QR for student: {student_name} (ID: {student_id})")
-        
-        # Generate QR code
-        qr_path = generate_student_qr(student_id)
-        
-        if qr_path and os.path.exists(qr_path):
-            # Verify the file is readable and has content
-            file_size = os.path.getsize(qr_path)
-            if file_size > 0:
-                # Create safe filename for ZIP
-                safe_filename = create_safe_filename(f"{student_name}_QR.png")
-                valid_qr_files.append((qr_path, safe_filename))
-                logging.debug(f"QR generated successfully: {qr_path} ({file_size} bytes)")
-            else:
-                logging.warning(f"QR file is empty: {qr_path}")
+    for student, qr_path in zip(students, qr_paths):
+        if qr_path:
+            # Create safe filename for ZIP
+            safe_filename = create_safe_filename(f"{student['name']}_QR.png")
+            valid_qr_files.append((qr_path, safe_filename))
         else:
-            logging.error(f"Failed to generate QR for student {student_id}")
+            logging.error(f"Failed to generate QR for student {student['student_id']}")
     
     if not valid_qr_files:
         raise HTTPException(status_code=500, detail="Failed to generate any QR codes")
     
     logging.info(f"Successfully generated {len(valid_qr_files)} QR codes")
     
-    # Create a temporary zip file using file manager
-    zip_filename = f"group_{group_id}_qrcodes_{int(time.time())}.zip"
-    zip_path = file_manager.create_temp_file(suffix='.zip', prefix=f'group_{group_id}_qrcodes_')
+    # Members are stored uncompressed, so the archive is their total size plus small
+    # per-member headers; enforce the size limit before streaming starts
+    total_bytes = sum(os.stat(qr_path).st_size for qr_path, _ in valid_qr_files)
+    if total_bytes > config.MAX_FILE_SIZE_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"ZIP file too large. Maximum size: {config.MAX_FILE_SIZE_MB}MB")
     
-    try:
-        # Create ZIP file with proper compression
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zip_file:
-            for qr_path, filename in valid_qr_files:
-                if os.path.exists(qr_path):
-                    # Add file to ZIP
-                    zip_file.write(qr_path, filename)
-                    logging.debug(f"Added to ZIP: {filename}")
-                else:
-                    logging.warning(f"File not found when adding to ZIP: {qr_path}")
-        
-        # Verify ZIP file was created and has content
-        if not os.path.exists(zip_path):
-            file_manager.cleanup_file(zip_path)  # Clean up on failure
-            raise HTTPException(status_code=500, detail="Failed to create ZIP file")
-        
-        # Validate file size
-        if not file_manager.validate_file_size(zip_path):
-            file_manager.cleanup_file(zip_path)  # Clean up oversized file
-            raise HTTPException(status_code=413, detail=f"ZIP file too large. Maximum size: {config.MAX_FILE_SIZE_MB}MB")
-        
-        zip_size = os.path.getsize(zip_path)
-        if zip_size == 0:
-            file_manager.cleanup_file(zip_path)  # Clean up empty file
-            raise HTTPException(status_code=500, detail="Generated ZIP file is empty")
-        
-        logging.info(f"ZIP file created successfully: {zip_path} ({zip_size} bytes)")
-        
-        # Test ZIP file integrity
-        try:
-            with zipfile.ZipFile(zip_path, 'r') as test_zip:
-                file_list = test_zip.namelist()
-                logging.debug(f"ZIP contains {len(file_list)} files: {file_list}")
-                # Test if we can read the ZIP
-                test_zip.testzip()
-        except Exception as e:
-            file_manager.cleanup_file(zip_path)  # Clean up corrupted file
-            logging.error(f"ZIP integrity test failed: {e}")
-            raise HTTPException(status_code=500, detail=f"ZIP file is corrupted: {e}")
-        
-        # Return the zip file as a response
-        return FileResponse(
-            zip_path, 
-            media_type="application/zip",
-            filename=f"group_{group_id}_qrcodes.zip",
-            headers={"Content-Disposition": f"attachment; filename=group_{group_id}_qrcodes.zip"}
-        )
-        
-    except Exception as e:
-        print(f"Error creating ZIP file: {e}")
-        # Clean up if ZIP creation failed
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
-        raise HTTPException(status_code=500, detail=f"Failed to create ZIP file: {e}")
+    # Stream the ZIP so the download starts while later members are still being added
+    return StreamingResponse(
+        _iter_qr_zip(valid_qr_files),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=group_{group_id}_qrcodes.zip"}
+    )
@@ -0,0 +1,112 @@
+# Tests for the hand-rolled HS256 verifier in auth/JWT.py
+import base64
+import json
+import os
+import tempfile
+import time
+import unittest
+
+# Keep the database created on import out of the working tree
+os.environ.setdefault('DATABASE_PATH', tempfile.mkdtemp(prefix='teacher_app_test_'))
+
+import jwt
+from fastapi import HTTPException
+
+from auth import JWT
+from config import config
+
+SECRET = config.JWT_SECRET_KEY
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+def _claims(**overrides) -> dict:
+    now = int(time.time())
+    claims = {"username": "alice", "teacher_id": 1, "type": "access_token", "iat": now, "exp": now + 60}
+    claims.update(overrides)
+    return {k: v for k, v in claims.items() if v is not None}
+
+def _hs256(**overrides) -> str:
+    return jwt.encode(_claims(**overrides), SECRET, algorithm="HS256")
+
+class DecodeHS256Tests(unittest.TestCase):
+    """_decode_hs256 must accept and reject exactly what jwt.decode does"""
+    
+    def assert_rejected_like_pyjwt(self, token: str, expected: type):
+        with self.assertRaises(expected):
+            jwt.decode(token, SECRET, algorithms=["HS256"])
+        with self.assertRaises(expected):
+            JWT._decode_hs256(token)
+    
+    def test_valid_token(self):
+        token = _hs256()
+        self.assertEqual(JWT._decode_hs256(token), jwt.decode(token, SECRET, algorithms=["HS256"]))
+    
+    def test_tampered_payload(self):
+        header, _, signature = _hs256().split('.')
+        forged = _b64(json.dumps(_claims(username="mallory")).encode())
+        self.assert_rejected_like_pyjwt(f"{header}.{forged}.{signature}", jwt.InvalidSignatureError)
+    
+    def test_wrong_secret(self):
+        token = jwt.encode(_claims(), SECRET + "-other", algorithm="HS256")
+        self.assert_rejected_like_pyjwt(token, jwt.InvalidSignatureError)
+    
+    def test_expired(self):
+        now = int(time.time())
+        self.assert_rejected_like_pyjwt(_hs256(iat=now - 120, exp=now - 60), jwt.ExpiredSignatureError)
+    
+    def test_future_nbf(self):
+        self.assert_rejected_like_pyjwt(_hs256(nbf=int(time.time()) + 3600), jwt.ImmatureSignatureError)
+    
+    def test_future_iat(self):
+        self.assert_rejected_like_pyjwt(_hs256(iat=int(time.time()) + 3600), jwt.ImmatureSignatureError)
+    
+    def test_non_numeric_claims(self):
+        self.assert_rejected_like_pyjwt(_hs256(exp="soon"), jwt.DecodeError)
+        self.assert_rejected_like_pyjwt(_hs256(nbf="later"), jwt.DecodeError)
+        self.assert_rejected_like_pyjwt(_hs256(iat="now"), jwt.InvalidIssuedAtError)
+    
+    def test_alg_none(self):
+        header = _b64(json.dumps({"alg": "none", "typ": "JWT"}).encode())
+        payload = _b64(json.dumps(_claims()).encode())
+        self.assert_rejected_like_pyjwt(f"{header}.{payload}.", jwt.InvalidAlgorithmError)
+    
+    def test_hs512(self):
+        token = jwt.encode(_claims(), SECRET, algorithm="HS512")
+        self.assert_rejected_like_pyjwt(token, jwt.InvalidAlgorithmError)
+    
+    def test_malformed(self):
+        for token in ("", "abc", "a.b", "a.b.c", "!!!.???.***", _hs256() + "@"):
+            with self.subTest(token=token):
+                with self.assertRaises(jwt.InvalidTokenError):
+                    JWT._decode_hs256(token)
+
+class VerifyTokenTests(unittest.TestCase):
+    
+    def assert_unauthorized(self, token: str):
+        with self.assertRaises(HTTPException) as ctx:
+            JWT.verify_token(token)
+        self.assertEqual(ctx.exception.status_code, 401)
+    
+    def test_valid_token_returns_username(self):
+        self.assertEqual(JWT.verify_token(_hs256()), "alice")
+    
+    def test_rejected_tokens_are_401(self):
+        now = int(time.time())
+        header, _, signature = _hs256().split('.')
+        forged = _b64(json.dumps(_claims(username="mallory")).encode())
+        for token in (
+            f"{header}.{forged}.{signature}",
+            _hs256(iat=now - 120, exp=now - 60),
+            _hs256(nbf=now + 3600),
+            jwt.encode(_claims(), SECRET, algorithm="HS512"),
+            "not-a-token",
+        ):
+            with self.subTest(token=token):
+                self.assert_unauthorized(token)
+    
+    def test_wrong_token_type(self):
+        self.assert_unauthorized(_hs256(type="refresh_token"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,13 @@
 # File management utilities for Teacher App Backend
 import os
+import re
+import stat
 import tempfile
 import time
 import logging
 import threading
-from typing import List, Optional
+from collections import OrderedDict
+from typing import Any, Callable, Optional, Set
 from pathlib import Path
 import zipfile
 import shutil
@@ -13,47 +16,92 @@ from config import config
 
 logger = logging.getLogger(__name__)
 
+# Runs of anything outside [A-Za-z0-9.-] (underscores included) collapse to one '_'
+_SAFE_RE = re.compile(r'[^A-Za-z0-9.-]+')
+
+_BYTES_PER_MB = 1024 * 1024
+
+def create_safe_filename(filename: str) -> str:
+    """Create a safe filename by removing/replacing problematic characters"""
+    # One pass replaces unsafe runs and collapses repeated underscores; then trim
+    # leading/trailing underscores and dots, falling back to 'file' if nothing is left
+    return _SAFE_RE.sub('_', filename).strip('_.') or 'file'
+
 class FileManager:
     """Manages temporary files and cleanup operations"""
     
     def __init__(self):
-        self.temp_files: List[str] = []
+        # path -> time.monotonic() when it was tracked; insertion order is age order
+        self.temp_files: "OrderedDict[str, float]" = OrderedDict()
         self.cleanup_lock = threading.Lock()
+        self._ensured_dirs: Set[str] = set()
         self._cleanup_interval = 3600  # 1 hour
         self._max_file_age = 86400  # 24 hours
         self._start_cleanup_scheduler()
     
     def _start_cleanup_scheduler(self):
         """Start background cleanup scheduler"""
-        def cleanup_worker():
-            while True:
-                try:
-                    time.sleep(self._cleanup_interval)
-                    self.cleanup_old_files()
-                except Exception as e:
-                    logger.error(f"Error in cleanup scheduler: {e}")
-        
-        cleanup_thread = threading.Thread(target=cleanup_worker, daemon=True)
-        cleanup_thread.start()
+        self._scheduler_stopped = False
+        self._schedule_cleanup()
         logger.info("File cleanup scheduler started")
     
+    def _schedule_cleanup(self):
+        """Arm a one-shot timer for the next cleanup run"""
+        self._cleanup_timer = threading.Timer(self._cleanup_interval, self._run_scheduled_cleanup)
+        self._cleanup_timer.daemon = True
+        self._cleanup_timer.start()
+    
+    def _run_scheduled_cleanup(self):
+        """Timer callback: clean up, then re-arm unless the scheduler was shut down"""
+        try:
+            self.cleanup_old_files()
+        except Exception as e:
+            logger.error("Error in cleanup scheduler: %s", e)
+        finally:
+            if not self._scheduler_stopped:
+                self._schedule_cleanup()
+    
+    def shutdown(self):
+        """Stop the background cleanup scheduler"""
+        self._scheduler_stopped = True
+        self._cleanup_timer.cancel()
+        logger.info("File cleanup scheduler stopped")
+    
+    def _ensure_dir(self, directory: str):
+        """Create a directory once; later calls for the same path skip the makedirs syscalls"""
+        if directory in self._ensured_dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._ensured_dirs.add(directory)
+    
+    def _retry_after_missing_dir(self, directory: str, fn: Callable[[], Any]) -> Any:
+        """Call fn, recreating directory and retrying once if it vanished after it was cached"""
+        try:
+            return fn()
+        except FileNotFoundError:
+            self._ensured_dirs.discard(directory)
+            self._ensure_dir(directory)
+            return fn()
+    
     def create_temp_file(self, suffix: str = '', prefix: str = 'teacher_app_', directory: str = None) -> str:
         """Create a temporary file and track it for cleanup"""
         if directory is None:
             directory = config.TEMP_DIR
         
         # Ensure directory exists
-        os.makedirs(directory, exist_ok=True)
+        self._ensure_dir(directory)
         
         # Create temporary file
-        fd, temp_path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=directory)
+        fd, temp_path = self._retry_after_missing_dir(
+            directory, lambda: tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=directory)
+        )
         os.close(fd)  # Close file descriptor, we just need the path
         
         # Track for cleanup
         with self.cleanup_lock:
-            self.temp_files.append(temp_path)
+            self.temp_files[temp_path] = time.monotonic()
         
-        logger.debug(f"Created temporary file: {temp_path}")
+        logger.debug("Created temporary file: %s", temp_path)
         return temp_path
     
     def create_temp_directory(self, prefix: str = 'teacher_app_', directory: str = None) -> str:
@@ -62,112 +110,149 @@ class FileManager:
             directory = config.TEMP_DIR
         
         # Ensure parent directory exists
-        os.makedirs(directory, exist_ok=True)
+        self._ensure_dir(directory)
         
         # Create temporary directory
-        temp_dir = tempfile.mkdtemp(prefix=prefix, dir=directory)
+        temp_dir = self._retry_after_missing_dir(
+            directory, lambda: tempfile.mkdtemp(prefix=prefix, dir=directory)
+        )
         
         # Track for cleanup
         with self.cleanup_lock:
-            self.temp_files.append(temp_dir)
+            self.temp_files[temp_dir] = time.monotonic()
         
-        logger.debug(f"Created temporary directory: {temp_dir}")
+        logger.debug("Created temporary directory: %s", temp_dir)
         return temp_dir
     
     def cleanup_file(self, file_path: str) -> bool:
         """Clean up a specific file or directory"""
         try:
-            if os.path.exists(file_path):
-                if os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-                    logger.debug(f"Removed temporary directory: {file_path}")
-                else:
-                    os.remove(file_path)
-                    logger.debug(f"Removed temporary file: {file_path}")
-                
-                # Remove from tracking list
-                with self.cleanup_lock:
-                    if file_path in self.temp_files:
-                        self.temp_files.remove(file_path)
-                
-                return True
+            st = os.stat(file_path)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.error("Error cleaning up file %s: %s", file_path, e)
+            return False
+        
+        if not self._cleanup_with_stat(file_path, st):
             return False
+        
+        # Remove from tracking set
+        with self.cleanup_lock:
+            self.temp_files.pop(file_path, None)
+        
+        return True
+    
+    def _cleanup_with_stat(self, file_path: str, st: os.stat_result) -> bool:
+        """Remove a file or directory using an already-fetched stat result (no locking)"""
+        try:
+            if stat.S_ISDIR(st.st_mode):
+                shutil.rmtree(file_path)
+                logger.debug("Removed temporary directory: %s", file_path)
+            else:
+                os.remove(file_path)
+                logger.debug("Removed temporary file: %s", file_path)
+            return True
         except Exception as e:
-            logger.error(f"Error cleaning up file {file_path}: {e}")
+            logger.error("Error cleaning up file %s: %s", file_path, e)
             return False
     
     def cleanup_old_files(self) -> int:
         """Clean up old temporary files"""
+        # Unlocked emptiness check: idle sweeps skip the lock entirely; a file
+        # tracked concurrently is simply picked up by the next sweep
+        if not self.temp_files:
+            return 0
+        
         cleaned_count = 0
         current_time = time.time()
         
+        # Entries are age-ordered, so only the head tracked longer than the max age
+        # can be old enough to remove; everything after it is skipped without a stat.
+        # Collect under the lock, then stat and delete without holding it so
+        # create_temp_file callers are never blocked behind filesystem work
+        cutoff = time.monotonic() - self._max_file_age
         with self.cleanup_lock:
-            files_to_remove = []
-            
-            for file_path in self.temp_files[:]:  # Create a copy to iterate
-                try:
-                    if os.path.exists(file_path):
-                        file_age = current_time - os.path.getmtime(file_path)
-                        if file_age > self._max_file_age:
-                            if self.cleanup_file(file_path):
-                                files_to_remove.append(file_path)
-                                cleaned_count += 1
-                    else:
-                        # File doesn't exist, remove from tracking
-                        files_to_remove.append(file_path)
-                except Exception as e:
-                    logger.error(f"Error checking file {file_path}: {e}")
+            expired_files = []
+            for file_path, tracked_at in self.temp_files.items():
+                if tracked_at > cutoff:
+                    break
+                expired_files.append(file_path)
+        
+        dropped_files = []
+        for file_path in expired_files:
+            # One stat per entry gives existence, age and file-vs-directory together
+            try:
+                st = os.stat(file_path)
+            except FileNotFoundError:
+                # File doesn't exist, drop it from tracking
+                dropped_files.append(file_path)
+                continue
+            except Exception as e:
+                logger.error("Error checking file %s: %s", file_path, e)
+                continue
             
-            # Remove cleaned files from tracking list
-            for file_path in files_to_remove:
-                if file_path in self.temp_files:
-                    self.temp_files.remove(file_path)
+            if current_time - st.st_mtime > self._max_file_age and self._cleanup_with_stat(file_path, st):
+                dropped_files.append(file_path)
+                cleaned_count += 1
+        
+        # Untrack cleaned and vanished files
+        if dropped_files:
+            with self.cleanup_lock:
+                for file_path in dropped_files:
+                    self.temp_files.pop(file_path, None)
         
         if cleaned_count > 0:
-            logger.info(f"Cleaned up {cleaned_count} old temporary files")
+            logger.info("Cleaned up %s old temporary files", cleaned_count)
         
         return cleaned_count
     
     def cleanup_qr_codes(self, max_age_hours: int = 24) -> int:
         """Clean up old QR code files"""
         qr_dir = config.QR_CODES_DIR
-        if not os.path.exists(qr_dir):
-            return 0
-        
         cleaned_count = 0
         current_time = time.time()
         max_age_seconds = max_age_hours * 3600
         
         try:
-            for filename in os.listdir(qr_dir):
-                file_path = os.path.join(qr_dir, filename)
-                if os.path.isfile(file_path) and filename.endswith('.png'):
-                    file_age = current_time - os.path.getmtime(file_path)
+            # scandir gets the entry type from the directory listing itself, leaving
+            # at most one stat per PNG for its mtime; a missing directory surfaces
+            # here instead of costing a separate exists() check
+            with os.scandir(qr_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.png') or not entry.is_file(follow_symlinks=False):
+                        continue
+                    try:
+                        file_age = current_time - entry.stat(follow_symlinks=False).st_mtime
+                    except FileNotFoundError:
+                        # Removed since the directory was listed
+                        continue
                     if file_age > max_age_seconds:
                         try:
-                            os.remove(file_path)
+                            os.unlink(entry.path)
                             cleaned_count += 1
-                            logger.debug(f"Removed old QR code: {filename}")
+                            logger.debug("Removed old QR code: %s", entry.name)
                         except Exception as e:
-                            logger.error(f"Error removing QR code {filename}: {e}")
+                            logger.error("Error removing QR code %s: %s", entry.name, e)
             
             if cleaned_count > 0:
-                logger.info(f"Cleaned up {cleaned_count} old QR code files")
+                logger.info("Cleaned up %s old QR code files", cleaned_count)
                 
+        except FileNotFoundError:
+            return 0
         except Exception as e:
-            logger.error(f"Error cleaning QR codes directory: {e}")
+            logger.error("Error cleaning QR codes directory: %s", e)
         
         return cleaned_count
     
     def get_file_size_mb(self, file_path: str) -> float:
         """Get file size in MB"""
         try:
-            if os.path.exists(file_path):
-                size_bytes = os.path.getsize(file_path)
-                return size_bytes / (1024 * 1024)
+            return os.stat(file_path).st_size / _BYTES_PER_MB
+        except FileNotFoundError:
             return 0.0
         except Exception as e:
-            logger.error(f"Error getting file size for {file_path}: {e}")
+            logger.error("Error getting file size for %s: %s", file_path, e)
             return 0.0
     
     def validate_file_size(self, file_path: str, max_size_mb: Optional[float] = None) -> bool:
@@ -177,29 +262,30 @@ class FileManager:
         
         file_size_mb = self.get_file_size_mb(file_path)
         if file_size_mb > max_size_mb:
-            logger.warning(f"File {file_path} exceeds size limit: {file_size_mb:.2f}MB > {max_size_mb}MB")
+            logger.warning("File %s exceeds size limit: %.2fMB > %sMB", file_path, file_size_mb, max_size_mb)
             return False
         
         return True
     
-    def create_safe_filename(self, filename: str) -> str:
-        """Create a safe filename by removing/replacing problematic characters"""
-        # Replace problematic characters
-        safe_chars = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789-_."
-        safe_filename = ''.join(c if c in safe_chars else '_' for c in filename)
-        
-        # Remove multiple underscores
-        while '__' in safe_filename:
-            safe_filename = safe_filename.replace('__', '_')
+    def validate_file_size_fd(self, fd: int, max_size_mb: Optional[float] = None) -> bool:
+        """Validate the size of an already-open file; fstat skips the path lookup and can't race a rename"""
+        if max_size_mb is None:
+            max_size_mb = config.MAX_FILE_SIZE_MB
         
-        # Remove leading/trailing underscores and dots
-        safe_filename = safe_filename.strip('_.')
+        try:
+            file_size_mb = os.fstat(fd).st_size / _BYTES_PER_MB
+        except OSError as e:
+            logger.error("Error getting file size for fd %s: %s", fd, e)
+            return False
         
-        # Ensure filename is not empty
-        if not safe_filename:
-            safe_filename = 'file'
+        if file_size_mb > max_size_mb:
+            logger.warning("File descriptor %s exceeds size limit: %.2fMB > %sMB", fd, file_size_mb, max_size_mb)
+            return False
         
-        return safe_filename
+        return True
+    
+    # Pure function; kept on the class for existing callers without binding self
+    create_safe_filename = staticmethod(create_safe_filename)
     
     def cleanup_all(self) -> dict:
         """Perform comprehensive cleanup and return statistics"""
@@ -217,25 +303,38 @@ class FileManager:
         
         stats['total_cleaned'] = stats['temp_files_cleaned'] + stats['qr_codes_cleaned']
         
-        logger.info(f"Cleanup completed: {stats}")
+        logger.info("Cleanup completed: %s", stats)
         return stats
 
-# Global file manager instance
-file_manager = FileManager()
+# Global file manager instance, created on first use so that importing this
+# module (e.g. just for create_safe_filename) doesn't start the cleanup scheduler
+_file_manager: Optional[FileManager] = None
+_file_manager_lock = threading.Lock()
+
+def get_file_manager() -> FileManager:
+    """Return the shared FileManager, creating it on first call"""
+    global _file_manager
+    if _file_manager is None:
+        with _file_manager_lock:
+            if _file_manager is None:
+                _file_manager = FileManager()
+    return _file_manager
+
+def __getattr__(name: str):
+    # Keep `from utils.file_manager import file_manager` working without eager creation
+    if name == 'file_manager':
+        return get_file_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Convenience functions
 def create_temp_file(suffix: str = '', prefix: str = 'teacher_app_') -> str:
     """Create a temporary file"""
-    return file_manager.create_temp_file(suffix=suffix, prefix=prefix)
+    return get_file_manager().create_temp_file(suffix=suffix, prefix=prefix)
 
 def create_temp_directory(prefix: str = 'teacher_app_') -> str:
     """Create a temporary directory"""
-    return file_manager.create_temp_directory(prefix=prefix)
+    return get_file_manager().create_temp_directory(prefix=prefix)
 
 def cleanup_file(file_path: str) -> bool:
     """Clean up a specific file"""
-    return file_manager.cleanup_file(file_path)
-
-def create_safe_filename(filename: str) -> str:
-    """Create a safe filename"""
-    return file_manager.create_safe_filename(filename)
+    return get_file_manager().cleanup_file(file_path)